@@ -7,7 +7,7 @@ on port 7200. It provides a web interface with file listings showing sizes and m
 
 Dependencies:
 - No external dependencies required (uses Python standard library only)
-- Requires Python 3.6+
+- Requires Python 3.7+
 
 Usage:
 - Run directly: python3 file_server.py
@@ -17,26 +17,91 @@ Usage:
 import os
 import sys
 import html
-import urllib.parse
+import email.utils
 import datetime
+import io
+import urllib.parse
+import functools
 import mimetypes
 import socket
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 import logging
-import traceback
+import logging.handlers
+import queue
 
 # === VARIABLES ===
 SERVER_PORT = int(os.getenv("SERVER_PORT", 7200))
 SERVE_DIRECTORY = os.getenv("SERVE_DIRECTORY", "/withings")
 LOG_FILE = os.getenv("LOG_FILE", "/var/log/file_server.log")
 BIND_ADDRESS = os.getenv("BIND_ADDRESS", "0.0.0.0")
-BUFFER_SIZE = int(os.getenv("BUFFER_SIZE", 1024 * 1024))
+SEND_BUFFER_SIZE = int(os.getenv("SEND_BUFFER_SIZE", 0))
 BASE_PATH = os.getenv("BASE_PATH", "/wt")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 64 * 1024))
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", 5))
+LISTING_CACHE_MAX_DIRS = int(os.getenv("LISTING_CACHE_MAX_DIRS", 128))
+FILE_CACHE_MAX_SIZE = int(os.getenv("FILE_CACHE_MAX_SIZE", 1024 * 1024))
+FILE_CACHE_MAX_FILES = int(os.getenv("FILE_CACHE_MAX_FILES", 64))
+
+# Resolved serve root with a trailing separator, computed once for the path checks
+_SERVE_ROOT = os.path.join(os.path.realpath(SERVE_DIRECTORY), '')
+
+# Directory scans by path: (dir mtime_ns, expiry on the monotonic clock, items)
+_listing_cache = {}
+_listing_cache_lock = threading.Lock()
+
+# Small files by path: ((inode, mtime_ns, size), content or None if seen once)
+_file_cache = {}
+_file_cache_lock = threading.Lock()
+
+# === HTML TEMPLATES ===
+_HTML_HEAD_TMPL = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Directory listing for %(url_path)s</title>
+<style>
+body { font-family: monospace; margin: 20px; }
+table { border-collapse: collapse; }
+th, td { padding: 5px 15px; text-align: left; }
+th { background-color: #f0f0f0; border-bottom: 2px solid #ddd; }
+tr:hover { background-color: #f5f5f5; }
+a { text-decoration: none; color: #0066cc; }
+a:hover { text-decoration: underline; }
+.dir { font-weight: bold; }
+.size { text-align: right; }
+</style>
+</head>
+<body>
+<h1>Directory listing for %(url_path)s</h1>
+'''
+_HTML_TABLE_OPEN = '''<table>
+<tr><th>Name</th><th>Size</th><th>Last Modified</th></tr>
+'''
+_HTML_FOOTER = '''</table>
+<hr>
+<p>%d items</p>
+</body>
+</html>'''
+
+# Same substitutions as html.escape(), applied in a single str.translate() pass
+_HTML_ESCAPE_TABLE = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    "'": '&#x27;',
+})
 
 # === LOGGING SETUP ===
 def setup_logging():
-    """Setup logging to both file and console"""
+    """Setup logging to both file and console
+
+    Records are handed to a background thread through a queue, so request
+    threads never block on the handler locks or on disk writes.
+    """
     log_format = '%(asctime)s - %(levelname)s - %(message)s'
     date_format = '%Y-%m-%d %H:%M:%S'
 
@@ -50,9 +115,10 @@ def setup_logging():
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
 
     # File handler
+    file_error = None
     try:
         # Create log directory if it doesn't exist
         log_dir = os.path.dirname(LOG_FILE)
@@ -61,232 +127,519 @@ def setup_logging():
 
         file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
     except Exception as e:
-        logging.error(f"Failed to create log file at {LOG_FILE}: {str(e)}")
+        file_error = e
 
-    return logger
+    # Queue handler, drained by a single listener thread
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+
+    if file_error:
+        logger.error("Failed to create log file at %s: %s", LOG_FILE, file_error)
+
+    return logger, listener
 
 # Initialize logging
-logger = setup_logging()
+logger, log_listener = setup_logging()
   
 class FileServerHandler(BaseHTTPRequestHandler):
     """Custom HTTP request handler for file serving"""
 
+    # Keep connections alive between requests; every response sets Content-Length
+    protocol_version = "HTTP/1.1"
+
+    # Drop idle keep-alive connections so they do not pin a thread forever
+    timeout = 60
+
+    # Set TCP_NODELAY on accepted connections; file responses are corked instead
+    disable_nagle_algorithm = True
+
+    # Buffer wfile so headers and a small body go out in a single send();
+    # the buffer is flushed after each request and before any sendfile()
+    wbufsize = 64 * 1024
+
+    def setup(self):
+        """Apply SEND_BUFFER_SIZE to the socket send buffer, if configured"""
+        super().setup()
+        # Left unset by default: a fixed SO_SNDBUF disables the kernel's send
+        # buffer autotuning and is capped by net.core.wmem_max
+        if SEND_BUFFER_SIZE > 0:
+            try:
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+            except OSError as e:
+                logger.warning("Failed to set send buffer size: %s", e)
+
+    def set_cork(self, enabled):
+        """Toggle TCP_CORK so headers and payload leave in full segments (Linux only)"""
+        if hasattr(socket, 'TCP_CORK'):
+            try:
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(enabled))
+            except OSError:
+                pass
+
     def do_GET(self):
         """Handle GET requests"""
         try:
-            # Parse the path and remove base path if present
-            parsed_path = urllib.parse.unquote(self.path)
+            # Remove query string if present, before decoding so that an
+            # escaped '?' in a file name is not mistaken for one
+            raw_path = self.path.partition('?')[0]
+
+            # Parse the path and remove base path if present; most requests
+            # carry no escapes and can skip unquoting altogether
+            parsed_path = urllib.parse.unquote(raw_path) if '%' in raw_path else raw_path
             if parsed_path.startswith(BASE_PATH):
                 parsed_path = parsed_path[len(BASE_PATH):]
             if not parsed_path.startswith('/'):
                 parsed_path = '/' + parsed_path
 
-            # Remove query string if present
-            parsed_path = parsed_path.split('?')[0]
+            # No file name can contain a NUL byte, and realpath() would raise on it
+            if '\x00' in parsed_path:
+                logger.warning("Path not found: %r", parsed_path)
+                self.send_error(404, "File not found")
+                return
 
-            # Construct full file path
-            full_path = os.path.normpath(os.path.join(SERVE_DIRECTORY, parsed_path.lstrip('/')))
+            # Construct full file path, resolving symlinks so that a link
+            # pointing outside SERVE_DIRECTORY cannot escape the check below
+            full_path = os.path.realpath(os.path.join(_SERVE_ROOT, parsed_path.lstrip('/')))
 
-            # Security check: ensure path is within SERVE_DIRECTORY
-            if not full_path.startswith(os.path.abspath(SERVE_DIRECTORY)):
-                logger.warning(f"Attempted access outside serve directory: {full_path}")
+            # Security check: ensure path is within SERVE_DIRECTORY. Comparing
+            # with a trailing separator keeps /withings_evil out of /withings
+            if not os.path.join(full_path, '').startswith(_SERVE_ROOT):
+                logger.warning("Attempted access outside serve directory: %s", full_path)
                 self.send_error(403, "Access denied")
                 return
 
-            logger.info(f"Processing request for: {parsed_path} -> {full_path}")
+            logger.info("Processing request for: %s -> %s", parsed_path, full_path)
 
             if os.path.isdir(full_path):
                 self.serve_directory(full_path, parsed_path)
             elif os.path.isfile(full_path):
                 self.serve_file(full_path)
             else:
-                logger.warning(f"Path not found: {full_path}")
+                logger.warning("Path not found: %s", full_path)
                 self.send_error(404, "File not found")
 
         except Exception as e:
-            logger.error(f"Error handling GET request for {self.path}: {str(e)}\n{traceback.format_exc()}")
+            logger.error("Error handling GET request for %s: %s", self.path, e, exc_info=logger.isEnabledFor(logging.DEBUG))
             self.send_error(500, f"Internal server error: {str(e)}")
 
     def serve_directory(self, dir_path, url_path):
         """Serve directory listing"""
+        streaming = False
         try:
-            # Get list of files and directories
-            items = []
-            for item in os.listdir(dir_path):
-                item_path = os.path.join(dir_path, item)
-                try:
-                    stat = os.stat(item_path)
-                    items.append({
-                        'name': item,
-                        'path': item_path,
-                        'is_dir': os.path.isdir(item_path),
-                        'size': stat.st_size,
-                        'mtime': stat.st_mtime
-                    })
-                except Exception as e:
-                    logger.warning(f"Failed to stat {item_path}: {str(e)}")
-
-            # Sort items: directories first, then alphabetically
-            items.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
+            # Get list of files and directories, reusing a recent scan while
+            # the directory itself is unchanged
+            items = list_directory(dir_path)
 
             # Generate HTML
-            html_content = self.generate_directory_html(items, url_path)
+            fragments = self.generate_directory_html(items, url_path)
 
             # Send response
             self.send_response(200)
             self.send_header('Content-Type', 'text/html; charset=utf-8')
-            self.send_header('Content-Length', len(html_content.encode('utf-8')))
-            self.end_headers()
-            self.wfile.write(html_content.encode('utf-8'))
+            if self.request_version == 'HTTP/1.1':
+                # Stream the listing so large directories render incrementally
+                # and are never held in memory as one HTML string
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                streaming = True
+                self.send_chunked(fragments)
+            else:
+                # HTTP/1.0 clients do not understand chunked encoding
+                body = ''.join(fragments).encode('utf-8')
+                self.send_header('Content-Length', len(body))
+                self.end_headers()
+                self.wfile.write(body)
 
-            logger.info(f"Successfully served directory listing for: {dir_path} ({len(items)} items)")
+            logger.info("Successfully served directory listing for: %s (%d items)", dir_path, len(items))
 
         except Exception as e:
-            logger.error(f"Error serving directory {dir_path}: {str(e)}\n{traceback.format_exc()}")
-            self.send_error(500, f"Error listing directory: {str(e)}")
+            logger.error("Error serving directory %s: %s", dir_path, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            if streaming:
+                # Too late for an error status; drop the connection so the
+                # client sees a truncated response rather than a complete one
+                self.close_connection = True
+            else:
+                self.send_error(500, f"Error listing directory: {str(e)}")
+
+    def send_chunked(self, fragments):
+        """Send text fragments using chunked transfer encoding, batched into CHUNK_SIZE chunks"""
+        buf = io.StringIO()
+        for fragment in fragments:
+            buf.write(fragment)
+            if buf.tell() >= CHUNK_SIZE:
+                self.write_chunk(buf.getvalue().encode('utf-8'))
+                buf = io.StringIO()
+        if buf.tell():
+            self.write_chunk(buf.getvalue().encode('utf-8'))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        """Write a single chunk of a chunked response"""
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
 
 
     def serve_file(self, file_path):
         """Serve a single file"""
         try:
-            # Get file size
-            file_size = os.path.getsize(file_path)
+            # Get file size and cache validators
+            st = os.stat(file_path)
+            file_size = st.st_size
+            etag = f'W/"{st.st_ino:x}-{st.st_size:x}-{int(st.st_mtime):x}"'
+            last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+
+            # Let clients with a current copy skip the transfer altogether
+            if self.is_not_modified(etag, st.st_mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', last_modified)
+                self.end_headers()
+                logger.info("Not modified, skipped sending file: %s", file_path)
+                return
 
             # Guess content type
-            content_type, _ = mimetypes.guess_type(file_path)
-            if not content_type:
-                content_type = 'application/octet-stream'
+            content_type = guess_content_type(os.path.splitext(file_path)[1].lower())
+
+            # Honour a single byte range so interrupted downloads can resume,
+            # unless If-Range shows the client holds a different version
+            range_header = self.headers.get('Range')
+            if range_header and not self.if_range_matches(st.st_mtime):
+                range_header = None
+            try:
+                byte_range = parse_byte_range(range_header, file_size)
+            except ValueError:
+                logger.warning("Unsatisfiable range %s for %s", range_header, file_path)
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{file_size}')
+                self.send_header('Content-Length', 0)
+                self.end_headers()
+                return
+
+            if byte_range:
+                start, end = byte_range
+            else:
+                start, end = 0, file_size - 1
+            length = end - start + 1
+
+            # Small, repeatedly requested files are served from memory,
+            # skipping the open() per request
+            content = None
+            if 0 < file_size <= FILE_CACHE_MAX_SIZE:
+                try:
+                    content = get_cached_file(file_path, st.st_ino, st.st_mtime_ns, file_size)
+                except OSError as e:
+                    logger.debug("Not caching %s: %s", file_path, e)
+
+            # Hold back partial segments until the payload has been queued
+            self.set_cork(True)
 
             # Send headers
-            self.send_response(200)
+            if byte_range:
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+            else:
+                self.send_response(200)
             self.send_header('Content-Type', content_type)
-            self.send_header('Content-Length', file_size)
+            self.send_header('Content-Length', length)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
             self.send_header('Content-Disposition', f'inline; filename="{os.path.basename(file_path)}"')
             self.end_headers()
 
             # Send file content
-            bytes_sent = 0
-            with open(file_path, 'rb') as f:
-                while True:
-                    chunk = f.read(BUFFER_SIZE)
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
-                    bytes_sent += len(chunk)
+            if content is not None:
+                self.wfile.write(memoryview(content)[start:start + length])
+                self.wfile.flush()
+                bytes_sent = length
+            else:
+                with open(file_path, 'rb') as f:
+                    bytes_sent = self.copy_file(f, start, length)
+            self.set_cork(False)
+
+            if bytes_sent != length:
+                # The file shrank mid-transfer; the body no longer matches
+                # Content-Length, so the connection cannot be reused
+                self.close_connection = True
+                logger.warning("Short transfer for file: %s (%d of %d bytes)", file_path, bytes_sent, length)
+                return
 
-            logger.info(f"Successfully served file: {file_path} ({bytes_sent} bytes)")
+            logger.info("Successfully served file: %s (%d bytes)", file_path, bytes_sent)
 
         except Exception as e:
-            logger.error(f"Error serving file {file_path}: {str(e)}\n{traceback.format_exc()}")
+            self.set_cork(False)
+            logger.error("Error serving file %s: %s", file_path, e, exc_info=logger.isEnabledFor(logging.DEBUG))
             self.send_error(500, f"Error serving file: {str(e)}")
 
+    def is_not_modified(self, etag, mtime):
+        """Check the request's conditional headers against the file validators"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            # If-None-Match takes precedence and uses weak comparison
+            if if_none_match.strip() == '*':
+                return True
+            opaque_tag = etag[2:]
+            return any(tag.strip() in (etag, opaque_tag) for tag in if_none_match.split(','))
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            since = parse_http_date(if_modified_since)
+            return since is not None and int(mtime) <= since
+
+        return False
+
+    def if_range_matches(self, mtime):
+        """Check whether a range request's If-Range still matches the file"""
+        if_range = self.headers.get('If-Range')
+        if not if_range:
+            return True
+
+        # Entity tags need strong comparison, which our weak ETag never passes
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/')):
+            return False
+
+        return int(mtime) == parse_http_date(if_range)
+
+    def copy_file(self, f, offset, count):
+        """Send count bytes of an open file to the client, starting at offset"""
+        if count <= 0:
+            return 0
+
+        # Push the buffered headers out before handing the socket to the kernel
+        self.wfile.flush()
+
+        # socket.sendfile() uses os.sendfile() for zero-copy transfer and falls
+        # back to a read/send loop where that is unavailable (e.g. TLS sockets)
+        return self.connection.sendfile(f, offset, count)
+
     def generate_directory_html(self, items, url_path):
-        """Generate HTML for directory listing"""
+        """Generate HTML for directory listing, yielded as a sequence of fragments"""
         # Ensure url_path ends with /
         if not url_path.endswith('/'):
             url_path += '/'
 
-        # Build HTML
-        html_parts = [
-            '<!DOCTYPE html>',
-            '<html>',
-            '<head>',
-            '<meta charset="utf-8">',
-            '<title>Directory listing for ' + html.escape(url_path) + '</title>',
-            '<style>',
-            'body { font-family: monospace; margin: 20px; }',
-            'table { border-collapse: collapse; }',
-            'th, td { padding: 5px 15px; text-align: left; }',
-            'th { background-color: #f0f0f0; border-bottom: 2px solid #ddd; }',
-            'tr:hover { background-color: #f5f5f5; }',
-            'a { text-decoration: none; color: #0066cc; }',
-            'a:hover { text-decoration: underline; }',
-            '.dir { font-weight: bold; }',
-            '.size { text-align: right; }',
-            '</style>',
-            '</head>',
-            '<body>',
-            '<h1>Directory listing for ' + html.escape(url_path) + '</h1>',
-            '<table>',
-            '<tr><th>Name</th><th>Size</th><th>Last Modified</th></tr>'
-        ]
+        escaped_url = html.escape(url_path)
+        yield _HTML_HEAD_TMPL % {'url_path': escaped_url}
+        yield _HTML_TABLE_OPEN
 
         # Add parent directory link if not at root
         if url_path != '/' and url_path.rstrip('/') != '':
             parent_path = os.path.dirname(url_path.rstrip('/'))
             if not parent_path.endswith('/'):
                 parent_path += '/'
-            html_parts.append(f'<tr><td colspan="3"><a href="{BASE_PATH}{parent_path}">[Parent Directory]</a></td></tr>')
+            yield f'<tr><td colspan="3"><a href="{BASE_PATH}{parent_path}">[Parent Directory]</a></td></tr>\n'
 
         # Add items
-        for item in items:
-            name = html.escape(item['name'])
-            if item['is_dir']:
+        for _, _, name, is_dir, size, mtime in items:
+            name = name.translate(_HTML_ESCAPE_TABLE)
+            if is_dir:
                 name_html = f'<a href="{BASE_PATH}{url_path}{name}/" class="dir">{name}/</a>'
                 size_html = '&lt;DIR&gt;'
             else:
                 name_html = f'<a href="{BASE_PATH}{url_path}{name}">{name}</a>'
-                size_html = format_size(item['size'])
-
-            mtime = datetime.datetime.fromtimestamp(item['mtime']).strftime('%Y-%m-%d %H:%M:%S')
+                size_html = format_size(size)
 
-            html_parts.append(
-                f'<tr><td>{name_html}</td><td class="size">{size_html}</td><td>{mtime}</td></tr>'
-            )
+            mtime_html = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
 
-        html_parts.extend([
-            '</table>',
-            '<hr>',
-            f'<p>{len(items)} items</p>',
-            '</body>',
-            '</html>'
-        ])
+            yield f'<tr><td>{name_html}</td><td class="size">{size_html}</td><td>{mtime_html}</td></tr>\n'
 
-        return '\n'.join(html_parts)
+        yield _HTML_FOOTER % len(items)
 
     def log_message(self, format, *args):
         """Override to suppress default console output"""
         # We're handling logging ourselves
         pass
 
+def list_directory(dir_path):
+    """Return the sorted entries of a directory, cached per directory mtime
+
+    Adding, removing or renaming an entry changes the directory mtime and
+    invalidates the cache at once. Files rewritten in place do not, so cached
+    scans also expire after LISTING_CACHE_TTL seconds (0 disables the cache).
+    Each directory keeps at most one scan, and at most LISTING_CACHE_MAX_DIRS
+    directories are cached.
+    """
+    if LISTING_CACHE_TTL <= 0:
+        return scan_directory(dir_path)
+
+    mtime_ns = os.stat(dir_path).st_mtime_ns
+    now = time.monotonic()
+    with _listing_cache_lock:
+        cached = _listing_cache.get(dir_path)
+    if cached and cached[0] == mtime_ns and now < cached[1]:
+        return cached[2]
+
+    items = scan_directory(dir_path)
+    with _listing_cache_lock:
+        # Replace any stale scan of this directory, then evict the oldest
+        # directories once the cache is full
+        _listing_cache.pop(dir_path, None)
+        while len(_listing_cache) >= LISTING_CACHE_MAX_DIRS:
+            _listing_cache.pop(next(iter(_listing_cache)))
+        _listing_cache[dir_path] = (mtime_ns, now + LISTING_CACHE_TTL, items)
+    return items
+
+def scan_directory(dir_path):
+    """Scan a directory into a tuple of entries, directories first, then by name"""
+    items = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            try:
+                # DirEntry caches the getdents/stat results, saving a
+                # stat + isdir syscall pair per entry; only symlinks cost
+                # an extra stat to describe their target
+                try:
+                    stat = entry.stat()
+                    is_dir = entry.is_dir()
+                except OSError:
+                    # Broken symlink: describe the link itself
+                    stat = entry.stat(follow_symlinks=False)
+                    is_dir = False
+                # (sort rank, sort name, name, is_dir, size, mtime); a plain
+                # tuple is far smaller than a dict and sorts without a key
+                items.append((0 if is_dir else 1, entry.name.casefold(), entry.name,
+                              is_dir, stat.st_size, stat.st_mtime))
+            except OSError as e:
+                logger.warning("Failed to stat %s: %s", entry.path, e)
+
+    # Sort items: directories first, then alphabetically
+    items.sort()
+    return tuple(items)
+
+def get_cached_file(file_path, inode, mtime_ns, size):
+    """Return a small file's content from memory, or None to read it from disk
+
+    A file is only read into memory on its second request for the same
+    version, so one-off downloads and range probes never fill the cache.
+    Entries are keyed on the path and replaced when the file changes, so a
+    file rewritten in place never leaves stale copies behind. The inode is
+    part of the version to catch files replaced by rename with the same size
+    and mtime (e.g. rsync -a, cp -p), matching the validators in the ETag.
+    """
+    version = (inode, mtime_ns, size)
+    with _file_cache_lock:
+        cached = _file_cache.pop(file_path, None)
+        if cached and cached[0] == version and cached[1] is not None:
+            # Re-insert to keep the dict in least recently used order
+            _file_cache[file_path] = cached
+            return cached[1]
+
+    content = None
+    if cached and cached[0] == version:
+        try:
+            content = read_small_file(file_path, version)
+        except ValueError as e:
+            logger.debug("Not caching %s: %s", file_path, e)
+            return None
+
+    with _file_cache_lock:
+        _file_cache.pop(file_path, None)
+        while len(_file_cache) >= FILE_CACHE_MAX_FILES:
+            _file_cache.pop(next(iter(_file_cache)))
+        _file_cache[file_path] = (version, content)
+    return content
+
+def read_small_file(file_path, version):
+    """Read a whole file, checking it still matches (inode, mtime_ns, size)
+
+    Raises ValueError if the file changed since it was stat'ed, so that a
+    partially rewritten file is never cached under the old validators.
+    """
+    size = version[2]
+    with open(file_path, 'rb') as f:
+        content = f.read(size + 1)
+        st = os.fstat(f.fileno())
+    if len(content) != size or (st.st_ino, st.st_mtime_ns, st.st_size) != version:
+        raise ValueError("file changed while reading")
+    return content
+
+def parse_http_date(value):
+    """Parse an HTTP date header into a POSIX timestamp, or None if malformed"""
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    # Dates given as -0000 parse as naive; HTTP dates are always in UTC
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date.timestamp()
+
+def parse_byte_range(range_header, file_size):
+    """Parse a single 'bytes=' Range header into an inclusive (start, end) pair
+
+    Returns None when there is no usable range and the whole file should be
+    sent. Raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+
+    first, sep, last = (part.strip() for part in spec.partition('-'))
+    if not sep or not (first or last) or not (first or '0').isdecimal() or not (last or '0').isdecimal():
+        return None
+
+    if first:
+        start = int(first)
+        end = int(last) if last else file_size - 1
+        if last and end < start:
+            return None
+    else:
+        # Suffix range: the last N bytes of the file
+        start = max(file_size - int(last), 0) if int(last) else file_size
+        end = file_size - 1
+
+    if start >= file_size:
+        raise ValueError(f"Range starts beyond end of file: {range_header}")
+    return start, min(end, file_size - 1)
+
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
 def format_size(size):
     """Format file size in human-readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if size < 1024.0:
-            if unit == 'B':
-                return f"{size} {unit}"
-            else:
-                return f"{size:.1f} {unit}"
-        size /= 1024.0
-    return f"{size:.1f} PB"
+    if size < 1024:
+        return f"{size} B"
+    # Each unit is 2**10 of the previous one, so bit_length() picks it directly
+    unit_idx = min((size.bit_length() - 1) // 10, len(SIZE_UNITS) - 1)
+    return f"{size / (1 << (unit_idx * 10)):.1f} {SIZE_UNITS[unit_idx]}"
+
+@functools.lru_cache(maxsize=256)
+def guess_content_type(ext):
+    """Guess the content type for a file extension, memoized per extension"""
+    content_type, _ = mimetypes.guess_type('x' + ext)
+    return content_type or 'application/octet-stream'
 
 def main():
     """Main server function"""
     try:
         logger.info("=" * 60)
         logger.info("Starting HTTP File Server")
-        logger.info(f"Serving directory: {SERVE_DIRECTORY}")
-        logger.info(f"Server port: {SERVER_PORT}")
-        logger.info(f"Bind address: {BIND_ADDRESS}")
-        logger.info(f"Base URL path: {BASE_PATH}")
+        logger.info("Serving directory: %s", SERVE_DIRECTORY)
+        logger.info("Server port: %s", SERVER_PORT)
+        logger.info("Bind address: %s", BIND_ADDRESS)
+        logger.info("Base URL path: %s", BASE_PATH)
         logger.info("=" * 60)
 
         # Check if serve directory exists
         if not os.path.exists(SERVE_DIRECTORY):
-            logger.error(f"Serve directory does not exist: {SERVE_DIRECTORY}")
+            logger.error("Serve directory does not exist: %s", SERVE_DIRECTORY)
             logger.error("Please create the directory or update SERVE_DIRECTORY variable")
             sys.exit(1)
 
         if not os.path.isdir(SERVE_DIRECTORY):
-            logger.error(f"Serve path is not a directory: {SERVE_DIRECTORY}")
+            logger.error("Serve path is not a directory: %s", SERVE_DIRECTORY)
             sys.exit(1)
 
         # Create server
-        server = HTTPServer((BIND_ADDRESS, SERVER_PORT), FileServerHandler)
-        logger.info(f"Server started successfully on {BIND_ADDRESS}:{SERVER_PORT}")
-        logger.info(f"Access the server at: http://{socket.gethostname()}:{SERVER_PORT}{BASE_PATH}")
+        server = ThreadingHTTPServer((BIND_ADDRESS, SERVER_PORT), FileServerHandler)
+        server.daemon_threads = True
+        logger.info("Server started successfully on %s:%s", BIND_ADDRESS, SERVER_PORT)
+        logger.info("Access the server at: http://%s:%s%s", socket.gethostname(), SERVER_PORT, BASE_PATH)
         logger.info("Press Ctrl+C to stop the server")
 
         # Run server
@@ -297,12 +650,13 @@ def main():
         server.socket.close()
         logger.info("Server stopped successfully")
     except Exception as e:
-        logger.error(f"Failed to start server: {str(e)}\n{traceback.format_exc()}")
+        logger.error("Failed to start server: %s", e, exc_info=True)
         sys.exit(1)
     finally:
         logger.info("=" * 60)
         logger.info("File server terminated")
         logger.info("=" * 60)
+        log_listener.stop()
 
 if __name__ == "__main__":
     main()